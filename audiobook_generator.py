@@ -2,64 +2,237 @@
 # -*- coding: utf-8 -*-
 
 import os
+import json
+import shutil
+import asyncio
+import collections
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import aiofiles
+import httpx
 import requests
 import re
 from pathlib import Path
 import time
 import urllib.parse
 
+# 句末标点集合：固定的4个字符用成员测试即可，不需要正则引擎
+_SENT_TERMS = frozenset("。！？…")
+
+# 全局速率上限：每秒最多发出的TTS请求数（所有worker共享）
+RATE_LIMIT = 8
+
+# 从文件名中取章节号做自然排序（"第10章"应排在"第2章"之后）
+_RE_CHAPTER_NUM = re.compile(r'第(\d+)章')
+
+def _chapter_sort_key(name):
+    m = _RE_CHAPTER_NUM.search(name)
+    return (int(m.group(1)), name) if m else (float('inf'), name)
+
+class TTSBackend(ABC):
+    """TTS后端抽象基类：不同的合成服务实现同一个批量接口"""
+
+    @abstractmethod
+    async def synthesize_chunks(self, tasks, concurrency=4):
+        """合成一批 (文本, 输出文件) 片段，返回与tasks对应的bool列表"""
+
+class EdgeTTSBackend(TTSBackend):
+    """edge-tts HTTP包装服务：逐片段发请求，靠HTTP/2多路复用提速"""
+
+    def __init__(self, tts_url, voice, rate, pitch, rate_gate=None):
+        self.tts_url = tts_url
+        self.voice = voice
+        self.rate = rate
+        self.pitch = pitch
+        self.rate_gate = rate_gate  # 可选的异步限速闸门
+
+    async def _tts_async(self, client, sem, text, output_file):
+        """异步生成单个片段的音频"""
+        params = {
+            'text': text,
+            'voice': self.voice,
+            'rate': self.rate,
+            'pitch': self.pitch
+        }
+
+        async with sem:  # 信号量限制并发数，避免压垮TTS服务
+            try:
+                if self.rate_gate:
+                    await self.rate_gate()
+                async with client.stream('GET', f"{self.tts_url}/tts", params=params) as response:
+                    if response.status_code != 200:
+                        print(f"✗ TTS请求失败: {response.status_code}")
+                        return False
+                    # 边下边写，每个并发请求只占64KB左右的缓冲
+                    async with aiofiles.open(output_file, 'wb') as f:
+                        async for data in response.aiter_bytes(65536):
+                            await f.write(data)
+                print(f"✓ 生成音频: {output_file}")
+                return True
+            except Exception as e:
+                print(f"✗ 生成音频时出错: {e}")
+                return False
+
+    async def synthesize_chunks(self, tasks, concurrency=4):
+        """并发生成一批 (文本, 输出文件) 片段
+
+        服务端支持HTTP/2时，多个请求在一条TCP连接上多路复用；
+        HTTP/1.1服务端则退回keep-alive连接池。
+        """
+        sem = asyncio.Semaphore(concurrency)
+        limits = httpx.Limits(max_connections=8, max_keepalive_connections=8)
+        async with httpx.AsyncClient(http2=True, limits=limits, timeout=30.0) as client:
+            results = await asyncio.gather(
+                *[self._tts_async(client, sem, chunk, audio_file)
+                  for chunk, audio_file in tasks]
+            )
+        return results
+
+class CosyVoiceStreamingBackend(TTSBackend):
+    """CosyVoice流式后端：一条websocket会话推送整章片段
+
+    片段间的合成重叠发生在TTS服务端，客户端不需要再限速。
+    """
+
+    def __init__(self, ws_url, speaker="中文男"):
+        self.ws_url = ws_url
+        self.speaker = speaker
+
+    async def synthesize_chunks(self, tasks, concurrency=4):
+        import websockets  # 可选依赖，仅在使用CosyVoice后端时需要
+
+        results = []
+        async with websockets.connect(self.ws_url, max_size=None) as ws:
+            for text, output_file in tasks:
+                try:
+                    await ws.send(json.dumps({'text': text, 'speaker': self.speaker},
+                                             ensure_ascii=False))
+                    # 二进制帧是音频数据，收到文本帧表示该片段结束
+                    async with aiofiles.open(output_file, 'wb') as f:
+                        while True:
+                            frame = await ws.recv()
+                            if isinstance(frame, bytes):
+                                await f.write(frame)
+                            else:
+                                break
+                    print(f"✓ 生成音频: {output_file}")
+                    results.append(True)
+                except Exception as e:
+                    print(f"✗ 生成音频时出错: {e}")
+                    results.append(False)
+        return results
+
 class AudiobookGenerator:
-    def __init__(self, tts_url="http://192.168.31.252:5000"):
+    def __init__(self, tts_url="http://192.168.31.252:5000", backend=None):
         self.tts_url = tts_url
         self.voice = "zh-CN-YunxiNeural"  # 云希声音
         self.rate = "+0%"  # 正常语速
         self.pitch = "+0Hz"  # 正常音调
-        
+        # 复用同一个会话，keep-alive避免每个片段重新建立TCP连接
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # 令牌桶限速窗口：记录最近 RATE_LIMIT 个请求的时间戳
+        self._rate_lock = threading.Lock()
+        self._rate = collections.deque(maxlen=RATE_LIMIT)
+        # 可插拔的TTS后端，默认保持原来的edge-tts HTTP行为
+        self.backend = backend or EdgeTTSBackend(
+            tts_url, self.voice, self.rate, self.pitch,
+            rate_gate=self._rate_gate_async)
+
+    def _rate_wait(self):
+        """返回需要等待的秒数；为0时已记账放行"""
+        with self._rate_lock:
+            now = time.monotonic()
+            if len(self._rate) < self._rate.maxlen or now - self._rate[0] >= 1.0:
+                self._rate.append(now)
+                return 0.0
+            return 1.0 - (now - self._rate[0])
+
+    def _rate_gate(self):
+        """阻塞直到全局速率窗口允许发出下一个请求"""
+        while True:
+            wait = self._rate_wait()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def _rate_gate_async(self):
+        """异步版限速闸门，等待时不阻塞事件循环"""
+        while True:
+            wait = self._rate_wait()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def close(self):
+        """关闭HTTP会话"""
+        self.session.close()
+
+    def __del__(self):
+        try:
+            self.session.close()
+        except Exception:
+            pass
+
     def clean_text(self, text):
         """清理文本，移除序号等格式符号"""
-        # 移除行首的序号 (如: "1→", "123→")
-        text = re.sub(r'^\s*\d+→', '', text)
-        # 移除多余的空白行
-        text = re.sub(r'\n\s*\n', '\n', text)
-        # 移除首尾空白
-        text = text.strip()
-        return text
+        lines = []
+        for line in text.splitlines():
+            # 移除行首的序号 (如: "1→", "123→")，纯字符串操作即可，不需要正则
+            stripped = line.lstrip()
+            arrow = stripped.find('→')
+            if arrow > 0 and stripped[:arrow].isdigit():
+                line = stripped[arrow + 1:]
+            # 跳过空白行，相当于折叠多余的空行
+            if line.strip():
+                lines.append(line)
+        return "\n".join(lines).strip()
     
+    def iter_text_chunks(self, text, max_length=500):
+        """按句子把长文本切成贴近 max_length 的块，逐个yield
+
+        对文本做一次线性扫描：沿句末标点推进窗口，尽量把短句合并
+        到同一块里以减少TTS调用次数。句末标点保留在输出中。
+        生成器可以直接喂给请求提交端，不需要中间列表。
+        """
+        chunk_start = 0  # 当前块起点
+        sent_start = 0   # 当前句起点
+
+        # 句末标点位置，文本末尾视为最后一个句子的结束
+        ends = [i + 1 for i, ch in enumerate(text) if ch in _SENT_TERMS]
+        if not ends or ends[-1] < len(text):
+            ends.append(len(text))
+
+        for sent_end in ends:
+            if sent_end - sent_start > max_length:
+                # 单句超长：先收掉之前的块，再对这句强制切割
+                piece = text[chunk_start:sent_start].strip()
+                if piece:
+                    yield piece
+                for i in range(sent_start, sent_end, max_length):
+                    piece = text[i:min(i + max_length, sent_end)].strip()
+                    if piece:
+                        yield piece
+                chunk_start = sent_end
+            elif sent_end - chunk_start > max_length:
+                # 加上这句会超限，先输出当前块
+                piece = text[chunk_start:sent_start].strip()
+                if piece:
+                    yield piece
+                chunk_start = sent_start
+            sent_start = sent_end
+
+        # 末尾剩余部分
+        piece = text[chunk_start:].strip()
+        if piece:
+            yield piece
+
     def split_long_text(self, text, max_length=500):
         """将长文本按句子分割成较短的段落"""
-        sentences = re.split(r'[。！？…]', text)
-        chunks = []
-        current_chunk = ""
-        
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if not sentence:
-                continue
-                
-            # 如果当前句子本身就很长，强制分割
-            if len(sentence) > max_length:
-                if current_chunk:
-                    chunks.append(current_chunk)
-                    current_chunk = ""
-                chunks.append(sentence[:max_length])
-                if len(sentence) > max_length:
-                    chunks.append(sentence[max_length:])
-            # 如果加上当前句子会超过限制，先保存当前块
-            elif len(current_chunk) + len(sentence) > max_length:
-                if current_chunk:
-                    chunks.append(current_chunk)
-                current_chunk = sentence
-            else:
-                if current_chunk:
-                    current_chunk += "。" + sentence
-                else:
-                    current_chunk = sentence
-        
-        # 添加最后一个块
-        if current_chunk:
-            chunks.append(current_chunk)
-        
-        return chunks
+        return list(self.iter_text_chunks(text, max_length))
     
     def text_to_speech(self, text, output_file):
         """将文本转换为语音"""
@@ -72,16 +245,18 @@ class AudiobookGenerator:
                 'pitch': self.pitch
             }
             
-            response = requests.get(f"{self.tts_url}/tts", params=params, timeout=30)
-            
-            if response.status_code == 200:
-                with open(output_file, 'wb') as f:
-                    f.write(response.content)
-                print(f"✓ 生成音频: {output_file}")
-                return True
-            else:
-                print(f"✗ TTS请求失败: {response.status_code}")
-                return False
+            self._rate_gate()
+            # 流式写盘，不在内存里缓存整个MP3
+            with self.session.get(f"{self.tts_url}/tts", params=params,
+                                  timeout=30, stream=True) as response:
+                if response.status_code == 200:
+                    with open(output_file, 'wb') as f:
+                        shutil.copyfileobj(response.raw, f, length=65536)
+                    print(f"✓ 生成音频: {output_file}")
+                    return True
+                else:
+                    print(f"✗ TTS请求失败: {response.status_code}")
+                    return False
         except Exception as e:
             print(f"✗ 生成音频时出错: {e}")
             return False
@@ -90,39 +265,38 @@ class AudiobookGenerator:
         """为单个章节生成音频"""
         try:
             # 读取章节内容
-            with open(chapter_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
+            content = Path(chapter_file).read_text(encoding='utf-8')
+
             # 清理文本
             content = self.clean_text(content)
             if not content:
                 print(f"✗ 章节内容为空: {chapter_file}")
                 return False
-            
+
             # 获取章节名称
             chapter_name = Path(chapter_file).stem
             print(f"🎧 开始生成章节: {chapter_name}")
-            
-            # 分割长文本
-            text_chunks = self.split_long_text(content)
-            print(f"   分割为 {len(text_chunks)} 个音频片段")
-            
-            # 为每个文本块生成音频
+
+            # 切块生成器直接喂给提交端；已存在的片段直接跳过（断点续传）
+            tasks = []
             audio_files = []
-            for i, chunk in enumerate(text_chunks):
-                if not chunk.strip():
-                    continue
-                    
+            for i, chunk in enumerate(self.iter_text_chunks(content)):
                 audio_file = os.path.join(output_dir, f"{chapter_name}_part{i+1:02d}.mp3")
-                if self.text_to_speech(chunk, audio_file):
+                if os.path.exists(audio_file) and os.path.getsize(audio_file) > 1024:
                     audio_files.append(audio_file)
-                    time.sleep(0.5)  # 避免请求过快
-                else:
-                    print(f"✗ 片段 {i+1} 生成失败")
-            
+                    continue
+                tasks.append((chunk, audio_file))
+            print(f"   分割为 {len(tasks) + len(audio_files)} 个音频片段")
+
+            if tasks:
+                results = asyncio.run(self.backend.synthesize_chunks(tasks))
+                for (chunk, audio_file), ok in zip(tasks, results):
+                    if ok:
+                        audio_files.append(audio_file)
+
             print(f"✓ 章节完成: {chapter_name} ({len(audio_files)} 个音频文件)")
-            return True
-            
+            return len(audio_files) > 0
+
         except Exception as e:
             print(f"✗ 处理章节时出错 {chapter_file}: {e}")
             return False
@@ -134,8 +308,11 @@ class AudiobookGenerator:
             print(f"✗ 卷目录不存在: {volume_dir}")
             return False
         
-        # 获取所有章节文件
-        chapter_files = sorted([f for f in volume_path.glob("*.txt")])
+        # 获取所有章节文件（scandir复用缓存的stat信息，并按章节号自然排序）
+        with os.scandir(volume_path) as it:
+            entries = [e for e in it
+                       if e.name.endswith('.txt') and e.is_file(follow_symlinks=False)]
+        chapter_files = [e.path for e in sorted(entries, key=lambda e: _chapter_sort_key(e.name))]
         if not chapter_files:
             print(f"✗ 在目录中未找到章节文件: {volume_dir}")
             return False
@@ -146,12 +323,15 @@ class AudiobookGenerator:
         # 确保输出目录存在
         Path(output_dir).mkdir(parents=True, exist_ok=True)
         
-        # 为每个章节生成音频
+        # 多个章节并发生成（网络IO为主，线程即可）
         success_count = 0
-        for chapter_file in chapter_files:
-            if self.generate_chapter_audio(chapter_file, output_dir):
-                success_count += 1
-        
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(self.generate_chapter_audio, chapter_file, output_dir)
+                       for chapter_file in chapter_files]
+            for future in as_completed(futures):
+                if future.result():
+                    success_count += 1
+
         print(f"🎉 卷完成: {success_count}/{len(chapter_files)} 章节成功生成")
         return success_count > 0
 
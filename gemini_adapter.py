@@ -6,16 +6,23 @@ GEMINI项目适配器
 """
 
 import re
-import json
+import orjson
 from typing import Dict, List, Optional
 from pathlib import Path
 from datetime import datetime
 
 from novel_writing_agent import (
-    NovelWritingAgent, ProjectConfig, CharacterInfo, 
+    NovelWritingAgent, ProjectConfig, CharacterInfo,
     PlotThread, ChapterSummary
 )
 
+# 预编译正则，导入大项目时这些模式会命中上千次
+_RE_LOG_SECTION = re.compile(r'## \*\*剧情日志\*\*(.*?)(?=^##|\n---|\Z)', re.MULTILINE | re.DOTALL)
+_RE_LOG_SECTION_PLAIN = re.compile(r'## 剧情日志(.*?)(?=^##|\n---|\Z)', re.MULTILINE | re.DOTALL)
+_RE_CHAPTER_HEAD = re.compile(r'### \*\*第(\d+)章[：:：]([^*\n]+)\*\*')
+_RE_SECTION = re.compile(r'\*\s*\*\*(剧情进展|角色状态|关键线索)[：:]?\*\*\s*(.*?)(?=\*\s*\*\*|\Z)', re.DOTALL)
+_RE_CHAR = re.compile(r'\*\*([^(（]+)(?:\s*[（(]([^)）]*)[）)])?\s*[：:]\*\*([^*\n]+)')
+
 class GeminiProjectAdapter:
     """GEMINI项目适配器"""
     
@@ -51,29 +58,27 @@ class GeminiProjectAdapter:
     def import_data_to_agent(self, agent: NovelWritingAgent):
         """导入GEMINI数据到Agent"""
         
-        # 导入章节摘要和角色状态
+        # 导入章节摘要和角色状态：bulk接口负责去重、排序、落盘，
+        # 还会把agent上缓存的派生查询一并失效
         summaries = self.parse_gemini_plot_log()
-        for summary in summaries:
-            agent.add_chapter_summary(summary)
-            
-            # 提取角色信息
-            for char in summary.characters_involved:
-                if char not in agent.characters:
-                    agent.characters[char] = CharacterInfo(
-                        name=char,
-                        description="从GEMINI导入",
-                        current_state={}
-                    )
-        
+        agent.bulk_add_chapter_summaries(summaries)
+
+        # 先用set去重，再一次性批量创建新角色，避免逐个探测dict
+        all_names = set().union(*(s.characters_involved for s in summaries)) if summaries else set()
+        agent.characters.update({
+            name: CharacterInfo(name=name, description="从GEMINI导入", current_state={})
+            for name in all_names if name not in agent.characters
+        })
+
         # 分析并创建剧情线索
         threads = self.extract_plot_threads(summaries)
         for thread in threads:
-            agent.plot_threads[thread.id] = thread
+            # 走agent的入口，活跃索引和版本号才会跟着更新
+            agent.add_plot_thread(thread)
         
-        # 保存数据
+        # 保存数据（章节摘要在bulk导入时已经落盘）
         agent.save_characters()
         agent.save_plot_threads()
-        agent.save_chapter_summaries()
         
         print(f"成功导入 {len(summaries)} 个章节摘要")
         print(f"成功导入 {len(agent.characters)} 个角色")
@@ -83,15 +88,14 @@ class GeminiProjectAdapter:
         """解析GEMINI.md中的剧情日志"""
         if not self.gemini_file.exists():
             return []
-            
-        with open(self.gemini_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
+
+        content = self.gemini_file.read_text(encoding='utf-8')
+
         # 提取剧情日志部分
-        log_match = re.search(r'## \*\*剧情日志\*\*(.*?)(?=^##|\n---|\Z)', content, re.MULTILINE | re.DOTALL)
+        log_match = _RE_LOG_SECTION.search(content)
         if not log_match:
             # 尝试不带星号的格式
-            log_match = re.search(r'## 剧情日志(.*?)(?=^##|\n---|\Z)', content, re.MULTILINE | re.DOTALL)
+            log_match = _RE_LOG_SECTION_PLAIN.search(content)
             if not log_match:
                 print("未找到剧情日志部分")
                 return []
@@ -100,51 +104,44 @@ class GeminiProjectAdapter:
         print(f"找到剧情日志内容，长度: {len(log_content)}")
         print(f"剧情日志内容预览: {repr(log_content[:200])}")
         
-        # 解析每个章节摘要
-        chapter_pattern = r'### \*\*第(\d+)章[：:：]([^*]+)\*\*\n\n(.*?)(?=\n### |\Z)'
-        chapters = re.findall(chapter_pattern, log_content, re.DOTALL)
-        print(f"找到章节数量: {len(chapters)}")
-        
-        if not chapters:
-            # 尝试其他可能的模式
-            chapter_pattern2 = r'### \*\*第(\d+)章[：:：]([^*]+)\*\*\n\n(.*?)(?=### |\Z)'
-            chapters = re.findall(chapter_pattern2, log_content, re.DOTALL)
-            print(f"使用备用模式找到章节数量: {len(chapters)}")
-        
+        # 一次 finditer 找到所有章节标题，正文直接按切点位置切片，
+        # 避免 .*? 懒惰匹配在整个文档上回溯
+        matches = list(_RE_CHAPTER_HEAD.finditer(log_content))
+        print(f"找到章节数量: {len(matches)}")
+
         summaries = []
-        for chapter_num, title, content in chapters:
-            summary = self.parse_single_chapter_summary(int(chapter_num), title.strip(), content.strip())
+        for i, m in enumerate(matches):
+            body_end = matches[i + 1].start() if i + 1 < len(matches) else len(log_content)
+            body = log_content[m.end():body_end]
+            summary = self.parse_single_chapter_summary(int(m.group(1)), m.group(2).strip(), body.strip())
             if summary:
                 summaries.append(summary)
-        
+
         return summaries
     
     def parse_single_chapter_summary(self, chapter_num: int, title: str, content: str) -> Optional[ChapterSummary]:
         """解析单个章节摘要"""
         try:
-            # 提取剧情进展
-            plot_match = re.search(r'\*\s*\*\*剧情进展[：:]?\*\*\s*([^*]+)', content)
-            plot_progress = plot_match.group(1).strip() if plot_match else ""
-            
-            # 提取角色状态
+            # 一次扫描收集所有小节，按标签分发，代替三次独立的re.search
+            sections = {}
+            for m in _RE_SECTION.finditer(content):
+                sections[m.group(1)] = m.group(2).strip()
+
+            plot_progress = sections.get('剧情进展', '')
+
+            # 提取角色状态：匹配 **角色名 (境界):** 描述 的模式
             characters = []
-            char_section = re.search(r'\*\s*\*\*角色状态[：:]?\*\*\s*(.*?)(?=\*\s*\*\*|$)', content, re.DOTALL)
-            if char_section:
-                char_content = char_section.group(1)
-                # 匹配 **角色名 (境界):** 描述 的模式
-                char_pattern = r'\*\*([^(（]+)(?:\s*[（(]([^)）]*)[）)])?\s*[：:]\*\*([^*\n]+)'
-                char_matches = re.findall(char_pattern, char_content)
-                
-                for char_name, cultivation, status in char_matches:
+            char_content = sections.get('角色状态')
+            if char_content:
+                for char_name, cultivation, status in _RE_CHAR.findall(char_content):
                     char_name = char_name.strip()
                     if char_name:
                         characters.append(char_name)
-            
+
             # 提取关键事件
             key_events = []
-            events_match = re.search(r'\*\s*\*\*关键线索[：:]?\*\*\s*([^*]+)', content)
-            if events_match:
-                key_events = [events_match.group(1).strip()]
+            if sections.get('关键线索'):
+                key_events = [sections['关键线索']]
             
             return ChapterSummary(
                 chapter_num=chapter_num,
@@ -235,9 +232,9 @@ def migrate_gemini_project(project_root: str) -> NovelWritingAgent:
     # 创建工作流配置
     workflow_config = adapter.create_workflow_config()
     workflow_file = Path(project_root) / ".agent_data" / "workflow_config.json"
-    with open(workflow_file, 'w', encoding='utf-8') as f:
-        json.dump(workflow_config, f, ensure_ascii=False, indent=2)
-    
+    with open(workflow_file, 'wb') as f:
+        f.write(orjson.dumps(workflow_config, option=orjson.OPT_INDENT_2))
+
     print(f"GEMINI项目已成功迁移到通用Agent系统!")
     print(f"项目路径: {project_root}")
     
@@ -6,16 +6,24 @@ GEMINI项目适配器 - 修复版
 """
 
 import re
-import json
+import orjson
 from typing import Dict, List, Optional
 from pathlib import Path
 from datetime import datetime
 
 from novel_writing_agent import (
-    NovelWritingAgent, ProjectConfig, CharacterInfo, 
+    NovelWritingAgent, ProjectConfig, CharacterInfo,
     PlotThread, ChapterSummary
 )
 
+# 预编译解析用的正则（注意r''里只需要单反斜杠）
+_RE_CHAPTER_HEAD = re.compile(r'### \*\*第(\d+)章[：:\s]*([^*]+)\*\*')
+_RE_NEXT_VOLUME = re.compile(r'\n## \*\*第\d+卷')
+_RE_PLOT = re.compile(r'\*\s*\*\*剧情进展[：:]?\*\*\s*([^*]+)')
+_RE_CHAR_SECTION = re.compile(r'\*\s*\*\*角色状态[：:]?\*\*\s*(.*?)(?=\*\s*\*\*|$)', re.DOTALL)
+_RE_CHAR_ENTRY = re.compile(r'\*\s*\*\*([^(（]+)(?:\s*[（(]([^)）]*)[）)])?\s*[：:]?\*\*')
+_RE_CLUE = re.compile(r'\*\s*\*\*关键线索[：:]?\*\*\s*([^*]+)')
+
 class GeminiProjectAdapter:
     """GEMINI项目适配器"""
     
@@ -51,34 +59,28 @@ class GeminiProjectAdapter:
     def import_data_to_agent(self, agent: NovelWritingAgent):
         """导入GEMINI数据到Agent"""
         
-        # 导入章节摘要和角色状态
+        # 导入章节摘要和角色状态：bulk接口负责去重、排序、落盘，
+        # 还会把agent上缓存的派生查询一并失效
         summaries = self.parse_gemini_plot_log()
-        
-        all_characters = {}
-        for summary in summaries:
-            agent.add_chapter_summary(summary)
-            
-            # 收集角色信息
-            for char_name in summary.characters_involved:
-                if char_name not in all_characters:
-                    all_characters[char_name] = CharacterInfo(
-                        name=char_name,
-                        description="从GEMINI导入",
-                        current_state={}
-                    )
-        
-        # 更新agent的角色数据
+        agent.bulk_add_chapter_summaries(summaries)
+
+        # 先用set去重角色名，再一次性批量创建并更新
+        all_names = set().union(*(s.characters_involved for s in summaries)) if summaries else set()
+        all_characters = {
+            name: CharacterInfo(name=name, description="从GEMINI导入", current_state={})
+            for name in all_names if name not in agent.characters
+        }
         agent.characters.update(all_characters)
         
         # 分析并创建剧情线索
         threads = self.extract_plot_threads(summaries)
         for thread in threads:
-            agent.plot_threads[thread.id] = thread
+            # 走agent的入口，活跃索引和版本号才会跟着更新
+            agent.add_plot_thread(thread)
         
-        # 保存数据
+        # 保存数据（章节摘要在bulk导入时已经落盘）
         agent.save_characters()
         agent.save_plot_threads()
-        agent.save_chapter_summaries()
         
         print(f"成功导入 {len(summaries)} 个章节摘要")
         print(f"成功导入 {len(all_characters)} 个角色")
@@ -89,10 +91,9 @@ class GeminiProjectAdapter:
         if not self.gemini_file.exists():
             print(f"GEMINI文件不存在: {self.gemini_file}")
             return []
-            
-        with open(self.gemini_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
+
+        content = self.gemini_file.read_text(encoding='utf-8')
+
         # 查找剧情日志位置
         log_start = content.find("## **剧情日志**")
         if log_start == -1:
@@ -106,60 +107,41 @@ class GeminiProjectAdapter:
         log_content = content[log_start:]
         print(f"找到剧情日志，长度: {len(log_content)}")
         
-        # 查找所有章节 - 兼容多种格式
-        chapter_pattern = r'### \\*\\*第(\\d+)章[：:\\s]*([^*]+)\\*\\*'
-        chapters = re.findall(chapter_pattern, log_content)
-        print(f"找到章节数量: {len(chapters)}")
-        
+        # 一次 finditer 拿到全部章节标题位置，正文直接按位置切片，
+        # 不再用 .find() 从头重扫整个日志
+        matches = list(_RE_CHAPTER_HEAD.finditer(log_content))
+        print(f"找到章节数量: {len(matches)}")
+
         summaries = []
-        for i, (chapter_num, title) in enumerate(chapters):
-            # 获取该章节的完整内容
-            chapter_content = self.extract_chapter_content(log_content, int(chapter_num), i, chapters)
-            summary = self.parse_single_chapter_summary(int(chapter_num), title.strip(), chapter_content)
+        for i, m in enumerate(matches):
+            if i + 1 < len(matches):
+                chapter_end = matches[i + 1].start()
+            else:
+                # 最后一章：取到下一个卷的开始或文件结尾
+                next_volume_match = _RE_NEXT_VOLUME.search(log_content, m.end())
+                chapter_end = next_volume_match.start() if next_volume_match else len(log_content)
+            chapter_content = log_content[m.start():chapter_end].strip()
+            summary = self.parse_single_chapter_summary(int(m.group(1)), m.group(2).strip(), chapter_content)
             if summary:
                 summaries.append(summary)
-        
+
         return summaries
     
-    def extract_chapter_content(self, log_content: str, chapter_num: int, index: int, all_chapters: List) -> str:
-        """提取单个章节的完整内容"""
-        # 找到当前章节的开始位置
-        chapter_start = log_content.find(f"### **第{chapter_num}章")
-        if chapter_start == -1:
-            return ""
-        
-        # 确定章节结束位置
-        if index + 1 < len(all_chapters):
-            # 不是最后一章，找下一章的开始位置
-            next_chapter_num = all_chapters[index + 1][0]
-            next_chapter_start = log_content.find(f"### **第{next_chapter_num}章", chapter_start + 1)
-            if next_chapter_start != -1:
-                return log_content[chapter_start:next_chapter_start].strip()
-        
-        # 是最后一章或没找到下一章，找下一个卷的开始或文件结尾
-        next_volume_match = re.search(r'\\n## \\*\\*第\\d+卷', log_content[chapter_start + 1:])
-        if next_volume_match:
-            chapter_end = chapter_start + 1 + next_volume_match.start()
-            return log_content[chapter_start:chapter_end].strip()
-        
-        # 取到文件结尾
-        return log_content[chapter_start:].strip()
-    
     def parse_single_chapter_summary(self, chapter_num: int, title: str, content: str) -> Optional[ChapterSummary]:
         """解析单个章节摘要"""
         try:
             # 提取剧情进展
-            plot_match = re.search(r'\\*\\s*\\*\\*剧情进展[：:]?\\*\\*\\s*([^*]+)', content)
+            plot_match = _RE_PLOT.search(content)
             plot_progress = plot_match.group(1).strip() if plot_match else ""
-            
+
             # 提取角色信息
             characters = []
             # 查找角色状态部分
-            char_section_match = re.search(r'\\*\\s*\\*\\*角色状态[：:]?\\*\\*\\s*(.*?)(?=\\*\\s*\\*\\*|$)', content, re.DOTALL)
+            char_section_match = _RE_CHAR_SECTION.search(content)
             if char_section_match:
                 char_content = char_section_match.group(1)
                 # 匹配每个角色的条目
-                char_entries = re.findall(r'\\*\\s*\\*\\*([^(（]+)(?:\\s*[（(]([^)）]*)[）)])?\\s*[：:]?\\*\\*', char_content)
+                char_entries = _RE_CHAR_ENTRY.findall(char_content)
                 for char_entry in char_entries:
                     char_name = char_entry[0].strip()
                     if char_name and not char_name.startswith('第') and len(char_name) < 20:
@@ -167,7 +149,7 @@ class GeminiProjectAdapter:
             
             # 提取关键事件
             key_events = []
-            events_match = re.search(r'\\*\\s*\\*\\*关键线索[：:]?\\*\\*\\s*([^*]+)', content)
+            events_match = _RE_CLUE.search(content)
             if events_match:
                 key_events = [events_match.group(1).strip()]
             
@@ -257,8 +239,8 @@ def migrate_gemini_project(project_root: str) -> NovelWritingAgent:
     }
     
     workflow_file = Path(project_root) / ".agent_data" / "workflow_config.json"
-    with open(workflow_file, 'w', encoding='utf-8') as f:
-        json.dump(workflow_config, f, ensure_ascii=False, indent=2)
+    with open(workflow_file, 'wb') as f:
+        f.write(orjson.dumps(workflow_config, option=orjson.OPT_INDENT_2))
     
     print(f"\\nGEMINI项目已成功迁移到通用Agent系统!")
     print(f"项目路径: {project_root}")
@@ -6,15 +6,41 @@
 """
 
 import os
-import json
+import mmap
+import orjson
 import re
+from bisect import bisect_right
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from pathlib import Path
+from hashlib import blake2b
 import logging
 
-@dataclass
+_LOGGING_CONFIGURED = False
+
+# 卷与章节的映射：起始章节号单独抽成有序表，用二分查找代替逐个range探测
+_VOLUME_STARTS = [1, 16, 31, 48, 61, 79, 93, 107]
+_VOLUMES = [
+    ("第一卷", "青阳崛起"),
+    ("第二卷", "龙潜于渊"),
+    ("第三卷", "名动天下"),
+    ("第四卷", "初临上界"),
+    ("第五卷", "剑冠群雄"),
+    ("第六卷", "圣地风云"),
+    ("第七卷", "远古遗迹"),
+    ("第八卷", "万界天骄战"),
+]
+_MAX_CHAPTER = 125  # 第八卷的最后一章
+
+# GEMINI.md 章节标题的正则：按UTF-8字节编译，配合mmap直接扫文件，
+# 免去整读和解码（章节号本身是ASCII数字，int()直接吃bytes）
+_CHAPTER_HEAD_RE_B = re.compile(r'### \*\*第(\d+)章'.encode('utf-8'))
+
+# 数据类都带手写的 to_dict/from_dict：字段固定，直接按名取值，
+# 比 asdict 的递归deepcopy和 **kwargs 反射构造快得多
+
+@dataclass(slots=True)
 class CharacterState:
     """角色状态数据类"""
     name: str
@@ -23,8 +49,29 @@ class CharacterState:
     location: str
     relationships: Dict[str, str]
     special_items: List[str]
-    
-@dataclass
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "cultivation_level": self.cultivation_level,
+            "current_status": self.current_status,
+            "location": self.location,
+            "relationships": self.relationships,
+            "special_items": self.special_items,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "CharacterState":
+        return cls(
+            name=data["name"],
+            cultivation_level=data.get("cultivation_level", ""),
+            current_status=data.get("current_status", ""),
+            location=data.get("location", ""),
+            relationships=data.get("relationships") or {},
+            special_items=data.get("special_items") or [],
+        )
+
+@dataclass(slots=True)
 class PlotThread:
     """剧情线索数据类"""
     thread_id: str
@@ -34,7 +81,28 @@ class PlotThread:
     last_updated_chapter: int
     priority: str  # "high", "medium", "low"
 
-@dataclass
+    def to_dict(self) -> Dict:
+        return {
+            "thread_id": self.thread_id,
+            "description": self.description,
+            "status": self.status,
+            "first_mentioned_chapter": self.first_mentioned_chapter,
+            "last_updated_chapter": self.last_updated_chapter,
+            "priority": self.priority,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "PlotThread":
+        return cls(
+            thread_id=data["thread_id"],
+            description=data.get("description", ""),
+            status=data.get("status", "active"),
+            first_mentioned_chapter=data.get("first_mentioned_chapter", 0),
+            last_updated_chapter=data.get("last_updated_chapter", 0),
+            priority=data.get("priority", "medium"),
+        )
+
+@dataclass(slots=True)
 class ChapterSummary:
     """章节摘要数据类"""
     chapter_num: int
@@ -46,6 +114,32 @@ class ChapterSummary:
     word_count: int
     created_time: str
 
+    def to_dict(self) -> Dict:
+        # 嵌套的角色/线索也走各自的to_dict，整棵树不经过asdict
+        return {
+            "chapter_num": self.chapter_num,
+            "title": self.title,
+            "plot_progress": self.plot_progress,
+            "character_states": [cs.to_dict() for cs in self.character_states],
+            "key_events": self.key_events,
+            "plot_threads": [pt.to_dict() for pt in self.plot_threads],
+            "word_count": self.word_count,
+            "created_time": self.created_time,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ChapterSummary":
+        return cls(
+            chapter_num=data["chapter_num"],
+            title=data.get("title", ""),
+            plot_progress=data.get("plot_progress", ""),
+            character_states=[CharacterState.from_dict(cs) for cs in data.get("character_states") or []],
+            key_events=data.get("key_events") or [],
+            plot_threads=[PlotThread.from_dict(pt) for pt in data.get("plot_threads") or []],
+            word_count=data.get("word_count", 0),
+            created_time=data.get("created_time", ""),
+        )
+
 class NovelAgent:
     """小说写作 Agent 核心类"""
     
@@ -71,20 +165,41 @@ class NovelAgent:
         
         # 加载配置
         self.config = self.load_config()
+
+        # 各数据文件上次落盘内容的哈希，内容没变的保存直接跳过
+        self._last_saved_hash = {}
+
+        # 项目根目录的子目录清单：启动时扫一次，查卷目录时不再每次listdir
+        self._volume_dirs = {item.name: item for item in self.project_root.iterdir()
+                             if item.is_dir()}
         
     def setup_logging(self):
         """设置日志系统"""
-        log_file = self.data_dir / "agent.log"
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_file, encoding='utf-8'),
-                logging.StreamHandler()
-            ]
-        )
+        global _LOGGING_CONFIGURED
+        # 只配置一次：反复实例化时不重复往root logger挂FileHandler
+        if not _LOGGING_CONFIGURED:
+            log_file = self.data_dir / "agent.log"
+            logging.basicConfig(
+                level=logging.INFO,
+                format='%(asctime)s - %(levelname)s - %(message)s',
+                handlers=[
+                    logging.FileHandler(log_file, encoding='utf-8'),
+                    logging.StreamHandler()
+                ]
+            )
+            _LOGGING_CONFIGURED = True
         self.logger = logging.getLogger(__name__)
         
+    def _write_if_changed(self, path: Path, payload: bytes):
+        """内容与上次写入相同时跳过磁盘写"""
+        digest = blake2b(payload, digest_size=16).digest()
+        key = str(path)
+        if self._last_saved_hash.get(key) == digest:
+            return
+        with open(path, 'wb') as f:
+            f.write(payload)
+        self._last_saved_hash[key] = digest
+
     def load_config(self) -> Dict:
         """加载配置文件"""
         config_file = self.data_dir / "config.json"
@@ -99,8 +214,7 @@ class NovelAgent:
         }
         
         if config_file.exists():
-            with open(config_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
+            config = orjson.loads(config_file.read_bytes())
         else:
             config = default_config
             self.save_config(config)
@@ -110,98 +224,68 @@ class NovelAgent:
     def save_config(self, config: Dict):
         """保存配置文件"""
         config_file = self.data_dir / "config.json"
-        with open(config_file, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
+        with open(config_file, 'wb') as f:
+            f.write(orjson.dumps(config, option=orjson.OPT_INDENT_2))
             
     def load_characters(self) -> Dict[str, CharacterState]:
         """加载角色状态数据"""
         if self.characters_file.exists():
-            with open(self.characters_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return {name: CharacterState(**char_data) for name, char_data in data.items()}
+            data = orjson.loads(self.characters_file.read_bytes())
+            return {name: CharacterState.from_dict(char_data) for name, char_data in data.items()}
         return {}
         
     def save_characters(self):
         """保存角色状态数据"""
-        data = {name: asdict(char) for name, char in self.characters.items()}
-        with open(self.characters_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # orjson原生支持dataclass（嵌套的也会递归展开），保存端不再先手动转dict
+        self._write_if_changed(self.characters_file, orjson.dumps(self.characters, option=orjson.OPT_INDENT_2))
             
     def load_plot_threads(self) -> Dict[str, PlotThread]:
         """加载剧情线索数据"""
         if self.plot_threads_file.exists():
-            with open(self.plot_threads_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return {tid: PlotThread(**thread_data) for tid, thread_data in data.items()}
+            data = orjson.loads(self.plot_threads_file.read_bytes())
+            return {tid: PlotThread.from_dict(thread_data) for tid, thread_data in data.items()}
         return {}
         
     def save_plot_threads(self):
         """保存剧情线索数据"""
-        data = {tid: asdict(thread) for tid, thread in self.plot_threads.items()}
-        with open(self.plot_threads_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        self._write_if_changed(self.plot_threads_file, orjson.dumps(self.plot_threads, option=orjson.OPT_INDENT_2))
             
     def load_chapter_summaries(self) -> List[ChapterSummary]:
         """加载章节摘要数据"""
         if self.chapter_summaries_file.exists():
-            with open(self.chapter_summaries_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                summaries = []
-                for summary_data in data:
-                    summary_data['character_states'] = [CharacterState(**cs) for cs in summary_data['character_states']]
-                    summary_data['plot_threads'] = [PlotThread(**pt) for pt in summary_data['plot_threads']]
-                    summaries.append(ChapterSummary(**summary_data))
-                return summaries
+            data = orjson.loads(self.chapter_summaries_file.read_bytes())
+            return [ChapterSummary.from_dict(summary_data) for summary_data in data]
         return []
         
     def save_chapter_summaries(self):
         """保存章节摘要数据"""
-        data = []
-        for summary in self.chapter_summaries:
-            summary_dict = asdict(summary)
-            data.append(summary_dict)
-        with open(self.chapter_summaries_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        self._write_if_changed(self.chapter_summaries_file, orjson.dumps(self.chapter_summaries, option=orjson.OPT_INDENT_2))
             
     def get_latest_chapter_number(self) -> int:
         """获取最新章节号"""
         if self.chapter_summaries:
             return max(summary.chapter_num for summary in self.chapter_summaries)
         
-        # 从 GEMINI.md 剧情日志中解析
-        if self.gemini_file.exists():
-            with open(self.gemini_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                chapter_pattern = r'### \*\*第(\d+)章'
-                chapters = re.findall(chapter_pattern, content)
-                if chapters:
-                    return max(int(ch) for ch in chapters)
+        # 从 GEMINI.md 剧情日志中解析：mmap只读映射，内核按需换页
+        if self.gemini_file.exists() and self.gemini_file.stat().st_size > 0:
+            with open(self.gemini_file, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    nums = [int(m.group(1)) for m in _CHAPTER_HEAD_RE_B.finditer(mm)]
+            if nums:
+                return max(nums)
         
         return 0
         
     def get_volume_info(self, chapter_num: int) -> Tuple[str, str]:
         """根据章节号获取卷信息"""
-        volume_mapping = {
-            range(1, 16): ("第一卷", "青阳崛起"),
-            range(16, 31): ("第二卷", "龙潜于渊"),
-            range(31, 48): ("第三卷", "名动天下"),
-            range(48, 61): ("第四卷", "初临上界"),
-            range(61, 79): ("第五卷", "剑冠群雄"),
-            range(79, 93): ("第六卷", "圣地风云"),
-            range(93, 107): ("第七卷", "远古遗迹"),
-            range(107, 126): ("第八卷", "万界天骄战"),
-        }
-        
-        for chapter_range, (volume_name, volume_title) in volume_mapping.items():
-            if chapter_num in chapter_range:
-                return volume_name, volume_title
-                
-        return "未知卷", "未知标题"
+        if chapter_num < _VOLUME_STARTS[0] or chapter_num > _MAX_CHAPTER:
+            return "未知卷", "未知标题"
+        return _VOLUMES[bisect_right(_VOLUME_STARTS, chapter_num) - 1]
         
     def find_volume_directory(self, volume_name: str) -> Optional[Path]:
-        """查找卷目录"""
-        for item in self.project_root.iterdir():
-            if item.is_dir() and volume_name in item.name:
+        """查找卷目录（在启动时缓存的目录表里找）"""
+        for name, item in self._volume_dirs.items():
+            if volume_name in name:
                 return item
         return None
 
@@ -6,16 +6,31 @@
 """
 
 import os
-import json
+import bisect
+import orjson
 import re
 from datetime import datetime
 from typing import Dict, List, Optional, Any, Callable
-from dataclasses import dataclass, asdict, field
+from dataclasses import dataclass, field
 from pathlib import Path
 from abc import ABC, abstractmethod
+from functools import lru_cache
+from hashlib import blake2b
 import logging
 
-@dataclass
+_LOGGING_CONFIGURED = False
+
+
+@lru_cache(maxsize=4)
+def _read_text(path_str: str, mtime: float) -> str:
+    """按(路径, mtime)缓存的小文件读取，大纲这类每章都要重读的文件命中后零IO"""
+    with open(path_str, 'r', encoding='utf-8') as f:
+        return f.read()
+
+# 各数据类手写 to_dict/from_dict：构造和展开都是直接的字段访问，
+# 不走 asdict 的 deepcopy 遍历，也不走 **kwargs 的反射式构造
+
+@dataclass(slots=True)
 class ProjectConfig:
     """项目配置"""
     project_name: str
@@ -29,14 +44,58 @@ class ProjectConfig:
     outline_file: str = "故事大纲.md"
     agent_config_file: str = "agent.md"
 
-@dataclass 
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'project_name': self.project_name,
+            'author': self.author,
+            'genre': self.genre,
+            'min_word_count': self.min_word_count,
+            'target_word_count': self.target_word_count,
+            'max_word_count': self.max_word_count,
+            'chapter_naming_pattern': self.chapter_naming_pattern,
+            'workflow_config_file': self.workflow_config_file,
+            'outline_file': self.outline_file,
+            'agent_config_file': self.agent_config_file,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ProjectConfig':
+        return cls(
+            project_name=data['project_name'],
+            author=data['author'],
+            genre=data['genre'],
+            min_word_count=data.get('min_word_count', 3000),
+            target_word_count=data.get('target_word_count', 5000),
+            max_word_count=data.get('max_word_count', 8000),
+            chapter_naming_pattern=data.get('chapter_naming_pattern', "第{num}章 {title}.txt"),
+            workflow_config_file=data.get('workflow_config_file', "workflow.json"),
+            outline_file=data.get('outline_file', "故事大纲.md"),
+            agent_config_file=data.get('agent_config_file', "agent.md"),
+        )
+
+@dataclass(slots=True)
 class CharacterInfo:
-    """角色信息"""
+    """角色信息（slots省掉每个实例的__dict__，批量导入时更省内存）"""
     name: str
     description: str = ""
     current_state: Dict[str, Any] = field(default_factory=dict)
-    
-@dataclass
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'description': self.description,
+            'current_state': self.current_state,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'CharacterInfo':
+        return cls(
+            name=data['name'],
+            description=data.get('description', ''),
+            current_state=data.get('current_state') or {},
+        )
+
+@dataclass(slots=True)
 class PlotThread:
     """剧情线索"""
     id: str
@@ -45,8 +104,29 @@ class PlotThread:
     priority: str = "medium"  # high, medium, low
     first_chapter: int = 0
     last_chapter: int = 0
-    
-@dataclass
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'description': self.description,
+            'status': self.status,
+            'priority': self.priority,
+            'first_chapter': self.first_chapter,
+            'last_chapter': self.last_chapter,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'PlotThread':
+        return cls(
+            id=data['id'],
+            description=data['description'],
+            status=data.get('status', 'active'),
+            priority=data.get('priority', 'medium'),
+            first_chapter=data.get('first_chapter', 0),
+            last_chapter=data.get('last_chapter', 0),
+        )
+
+@dataclass(slots=True)
 class ChapterSummary:
     """章节摘要"""
     chapter_num: int
@@ -58,6 +138,31 @@ class ChapterSummary:
     word_count: int = 0
     created_time: str = field(default_factory=lambda: datetime.now().isoformat())
 
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'chapter_num': self.chapter_num,
+            'title': self.title,
+            'content_summary': self.content_summary,
+            'characters_involved': self.characters_involved,
+            'plot_threads': self.plot_threads,
+            'key_events': self.key_events,
+            'word_count': self.word_count,
+            'created_time': self.created_time,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ChapterSummary':
+        return cls(
+            chapter_num=data['chapter_num'],
+            title=data['title'],
+            content_summary=data['content_summary'],
+            characters_involved=data.get('characters_involved') or [],
+            plot_threads=data.get('plot_threads') or [],
+            key_events=data.get('key_events') or [],
+            word_count=data.get('word_count', 0),
+            created_time=data.get('created_time') or datetime.now().isoformat(),
+        )
+
 class WorkflowStep(ABC):
     """工作流步骤抽象基类"""
     
@@ -177,39 +282,40 @@ class WritingStep(WorkflowStep):
         review = context['review_result']
         check = context['check_result']
         
-        prompt = f"""
+        # 片段先攒进list，最后join一次，避免 += 反复拷贝整个prompt
+        parts = [f"""
 基于以下信息创作第{review['next_chapter_num']}章：
 
 ## 故事背景
 {review['outline'][:500]}...
 
 ## 最近章节情况
-"""
+"""]
         
         for chapter in review['recent_chapters'][-2:]:
-            prompt += f"- 第{chapter.chapter_num}章: {chapter.content_summary}\n"
+            parts.append(f"- 第{chapter.chapter_num}章: {chapter.content_summary}\n")
         
-        prompt += f"""
+        parts.append("""
 ## 主要角色状态
-"""
+""")
         for char_name, char_info in review['characters'].items():
-            prompt += f"- {char_name}: {char_info.description}\n"
+            parts.append(f"- {char_name}: {char_info.description}\n")
         
-        prompt += f"""
+        parts.append("""
 ## 需要处理的线索
-"""
+""")
         for thread in review['unresolved_threads']:
-            prompt += f"- {thread.description} (优先级: {thread.priority})\n"
+            parts.append(f"- {thread.description} (优先级: {thread.priority})\n")
         
-        prompt += f"""
+        parts.append("""
 ## 创作要求
 - 字数要求: 不少于3000字
 - 保持角色一致性
 - 推进主要情节
 - 处理至少一个未解决线索
-        """
+        """)
         
-        return prompt
+        return "".join(parts)
 
 class FinalizeStep(WorkflowStep):
     """收尾与保存步骤"""
@@ -277,36 +383,51 @@ class NovelWritingAgent:
         # 数据存储文件
         self.characters_file = self.data_dir / "characters.json"
         self.plot_threads_file = self.data_dir / "plot_threads.json"
-        self.chapter_summaries_file = self.data_dir / "chapter_summaries.json"
+        self.chapter_summaries_file = self.data_dir / "chapter_summaries.jsonl"
         
         # 加载数据
         self.characters = self.load_characters()
         self.plot_threads = self.load_plot_threads()
         self.chapter_summaries = self.load_chapter_summaries()
-        
+
+        # 活跃线索的id索引：状态一律走set_thread_status改，索引同步维护
+        self._active_thread_ids = {tid for tid, t in self.plot_threads.items()
+                                   if t.status == "active"}
+
+        # 派生查询的缓存：数据每次变化都使版本号+1，命中时O(1)返回
+        self._summaries_version = 0
+        self._threads_version = 0
+        self._latest_chapter_cache = None  # (version, value)
+        self._unresolved_cache = None      # ((summaries_version, threads_version), value)
+        self._plot_log_offset = None       # 剧情日志标题在配置文件里的字节偏移
+        self._last_saved_hash = {}         # 各数据文件上次落盘内容的哈希
+
         # 初始化工作流
         self.workflow = self.create_default_workflow()
         
     def setup_logging(self):
         """设置日志"""
-        log_file = self.data_dir / "agent.log"
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler(log_file, encoding='utf-8'),
-                logging.StreamHandler()
-            ]
-        )
+        global _LOGGING_CONFIGURED
+        # 只配置一次：反复实例化时不重复往root logger挂FileHandler
+        if not _LOGGING_CONFIGURED:
+            log_file = self.data_dir / "agent.log"
+            logging.basicConfig(
+                level=logging.INFO,
+                format='%(asctime)s - %(levelname)s - %(message)s',
+                handlers=[
+                    logging.FileHandler(log_file, encoding='utf-8'),
+                    logging.StreamHandler()
+                ]
+            )
+            _LOGGING_CONFIGURED = True
         self.logger = logging.getLogger(__name__)
     
     def load_project_config(self) -> ProjectConfig:
         """加载项目配置"""
         config_file = self.project_root / "project_config.json"
         if config_file.exists():
-            with open(config_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return ProjectConfig(**data)
+            data = orjson.loads(config_file.read_bytes())
+            return ProjectConfig.from_dict(data)
         else:
             # 默认配置
             return ProjectConfig(
@@ -318,8 +439,8 @@ class NovelWritingAgent:
     def save_project_config(self):
         """保存项目配置"""
         config_file = self.project_root / "project_config.json"
-        with open(config_file, 'w', encoding='utf-8') as f:
-            json.dump(asdict(self.config), f, ensure_ascii=False, indent=2)
+        with open(config_file, 'wb') as f:
+            f.write(orjson.dumps(self.config.to_dict(), option=orjson.OPT_INDENT_2))
     
     def create_default_workflow(self) -> List[WorkflowStep]:
         """创建默认工作流"""
@@ -330,87 +451,137 @@ class NovelWritingAgent:
             FinalizeStep()
         ]
     
+    def _write_if_changed(self, path: Path, payload: bytes):
+        """内容与上次写入相同时跳过磁盘写"""
+        digest = blake2b(payload, digest_size=16).digest()
+        key = str(path)
+        if self._last_saved_hash.get(key) == digest:
+            return
+        with open(path, 'wb') as f:
+            f.write(payload)
+        self._last_saved_hash[key] = digest
+
     def load_characters(self) -> Dict[str, CharacterInfo]:
         """加载角色数据"""
         if self.characters_file.exists():
-            with open(self.characters_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return {name: CharacterInfo(**char_data) for name, char_data in data.items()}
+            data = orjson.loads(self.characters_file.read_bytes())
+            return {name: CharacterInfo.from_dict(char_data) for name, char_data in data.items()}
         return {}
     
     def save_characters(self):
         """保存角色数据"""
-        data = {name: asdict(char) for name, char in self.characters.items()}
-        with open(self.characters_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # orjson原生支持dataclass（嵌套的也会递归展开），保存端不再先手动转dict
+        self._write_if_changed(self.characters_file, orjson.dumps(self.characters, option=orjson.OPT_INDENT_2))
     
     def load_plot_threads(self) -> Dict[str, PlotThread]:
         """加载剧情线索"""
         if self.plot_threads_file.exists():
-            with open(self.plot_threads_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return {tid: PlotThread(**thread_data) for tid, thread_data in data.items()}
+            data = orjson.loads(self.plot_threads_file.read_bytes())
+            return {tid: PlotThread.from_dict(thread_data) for tid, thread_data in data.items()}
         return {}
     
     def save_plot_threads(self):
         """保存剧情线索"""
-        data = {tid: asdict(thread) for tid, thread in self.plot_threads.items()}
-        with open(self.plot_threads_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        self._write_if_changed(self.plot_threads_file, orjson.dumps(self.plot_threads, option=orjson.OPT_INDENT_2))
     
     def load_chapter_summaries(self) -> List[ChapterSummary]:
-        """加载章节摘要"""
+        """加载章节摘要（JSON-Lines：一行一个摘要）"""
         if self.chapter_summaries_file.exists():
-            with open(self.chapter_summaries_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return [ChapterSummary(**summary_data) for summary_data in data]
-        return []
+            summaries = [ChapterSummary.from_dict(orjson.loads(line))
+                         for line in self.chapter_summaries_file.read_bytes().splitlines() if line]
+        else:
+            # 老项目还是整块JSON的chapter_summaries.json：读进来转成jsonl
+            legacy_file = self.data_dir / "chapter_summaries.json"
+            if not legacy_file.exists():
+                return []
+            summaries = [ChapterSummary.from_dict(d)
+                         for d in orjson.loads(legacy_file.read_bytes())]
+        # 文件里是追加序，内存里必须按章节号排好序（派生查询都依赖这一点），
+        # 顺手按章节号去重，后写的覆盖先写的
+        summaries = sorted({s.chapter_num: s for s in summaries}.values(),
+                           key=lambda s: s.chapter_num)
+        if not self.chapter_summaries_file.exists():
+            self.chapter_summaries_file.write_bytes(
+                b"".join(orjson.dumps(s) + b"\n" for s in summaries))
+        return summaries
     
     def save_chapter_summaries(self):
-        """保存章节摘要"""
-        data = [asdict(summary) for summary in self.chapter_summaries]
-        with open(self.chapter_summaries_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        """整体重写章节摘要文件（只在去重/批量导入时需要）"""
+        payload = b"".join(orjson.dumps(summary) + b"\n"
+                           for summary in self.chapter_summaries)
+        self._write_if_changed(self.chapter_summaries_file, payload)
     
     def load_outline(self) -> str:
         """加载故事大纲"""
         outline_file = self.project_root / self.config.outline_file
         if outline_file.exists():
-            with open(outline_file, 'r', encoding='utf-8') as f:
-                return f.read()
+            # mtime 作为缓存key的一部分，文件没改过就直接复用上次读的内容
+            return _read_text(str(outline_file), outline_file.stat().st_mtime)
         return ""
     
     def get_latest_chapter_number(self) -> int:
         """获取最新章节号"""
-        if self.chapter_summaries:
-            return max(summary.chapter_num for summary in self.chapter_summaries)
-        return 0
+        cached = self._latest_chapter_cache
+        if cached is not None and cached[0] == self._summaries_version:
+            return cached[1]
+        # chapter_summaries 始终按章节号排好序
+        latest = self.chapter_summaries[-1].chapter_num if self.chapter_summaries else 0
+        self._latest_chapter_cache = (self._summaries_version, latest)
+        return latest
     
     def get_recent_chapters(self, count: int = 3) -> List[ChapterSummary]:
-        """获取最近章节"""
-        if not self.chapter_summaries:
-            return []
-        sorted_summaries = sorted(self.chapter_summaries, key=lambda x: x.chapter_num, reverse=True)
-        return sorted_summaries[:count]
+        """获取最近章节（摘要列表始终按章节号升序，直接取尾部倒序即可）"""
+        return list(reversed(self.chapter_summaries[-count:]))
     
     def get_all_characters(self) -> Dict[str, CharacterInfo]:
         """获取所有角色"""
         return self.characters
     
     def get_active_plot_threads(self) -> List[PlotThread]:
-        """获取活跃线索"""
-        return [thread for thread in self.plot_threads.values() if thread.status == "active"]
+        """获取活跃线索（按plot_threads的插入序遍历，结果顺序稳定）"""
+        active = self._active_thread_ids
+        return [t for tid, t in self.plot_threads.items() if tid in active]
+    
+    def add_plot_thread(self, thread: PlotThread):
+        """添加（或覆盖）剧情线索，并同步活跃索引"""
+        self.plot_threads[thread.id] = thread
+        if thread.status == "active":
+            self._active_thread_ids.add(thread.id)
+        else:
+            self._active_thread_ids.discard(thread.id)
+        self._threads_version += 1
+    
+    def set_thread_status(self, thread_id: str, status: str):
+        """修改线索状态并同步活跃索引"""
+        thread = self.plot_threads.get(thread_id)
+        if thread is None or thread.status == status:
+            return
+        thread.status = status
+        if status == "active":
+            self._active_thread_ids.add(thread_id)
+        else:
+            self._active_thread_ids.discard(thread_id)
+        self._threads_version += 1
     
     def find_unresolved_threads(self) -> List[PlotThread]:
         """查找未解决线索"""
+        version = (self._summaries_version, self._threads_version)
+        cached = self._unresolved_cache
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
         latest_chapter = self.get_latest_chapter_number()
         unresolved = []
         
-        for thread in self.plot_threads.values():
-            if thread.status == "active" and (latest_chapter - thread.last_chapter) > 3:
+        # 按插入序遍历、用活跃索引过滤，输出顺序在不同进程间保持一致
+        active = self._active_thread_ids
+        for tid, thread in self.plot_threads.items():
+            if tid in active and (latest_chapter - thread.last_chapter) > 3:
                 unresolved.append(thread)
         
-        return sorted(unresolved, key=lambda x: x.priority == "high", reverse=True)
+        result = sorted(unresolved, key=lambda x: x.priority == "high", reverse=True)
+        self._unresolved_cache = (version, result)
+        return result
     
     def save_chapter(self, chapter_num: int, title: str, content: str) -> Path:
         """保存章节文件"""
@@ -435,11 +606,27 @@ class NovelWritingAgent:
         return self.project_root / f"第{volume_num}卷"
     
     def add_chapter_summary(self, summary: ChapterSummary):
-        """添加章节摘要"""
-        # 移除相同章节号的旧摘要
-        self.chapter_summaries = [s for s in self.chapter_summaries if s.chapter_num != summary.chapter_num]
-        self.chapter_summaries.append(summary)
-        self.chapter_summaries.sort(key=lambda x: x.chapter_num)
+        """添加章节摘要（新章节号只做O(1)的追加写）"""
+        self._summaries_version += 1
+        nums = [s.chapter_num for s in self.chapter_summaries]
+        idx = bisect.bisect_left(nums, summary.chapter_num)
+        if idx < len(nums) and nums[idx] == summary.chapter_num:
+            # 同章节号覆盖旧摘要：少见情况，才整体重写
+            self.chapter_summaries[idx] = summary
+            self.save_chapter_summaries()
+            return
+        self.chapter_summaries.insert(idx, summary)
+        with open(self.chapter_summaries_file, 'ab') as f:
+            f.write(orjson.dumps(summary) + b"\n")
+    
+    def bulk_add_chapter_summaries(self, summaries: List[ChapterSummary]):
+        """批量导入章节摘要：去重、排序一次，落盘一次"""
+        if not summaries:
+            return
+        self._summaries_version += 1
+        merged = {s.chapter_num: s for s in self.chapter_summaries}
+        merged.update({s.chapter_num: s for s in summaries})
+        self.chapter_summaries = sorted(merged.values(), key=lambda s: s.chapter_num)
         self.save_chapter_summaries()
     
     def update_plot_log(self, summary: ChapterSummary):
@@ -456,17 +643,42 @@ class NovelWritingAgent:
 """
         
         if agent_file.exists():
+            header_b = "## 剧情日志".encode('utf-8')
+
+            # 热路径：上次已经定位过日志标题，直接seek过去，
+            # 只把标题之后的尾部搬一次，不再整读整写全文
+            if self._plot_log_offset is not None:
+                with open(agent_file, 'r+b') as f:
+                    f.seek(self._plot_log_offset)
+                    if f.read(len(header_b)) == header_b:
+                        tail = f.read()
+                        f.seek(self._plot_log_offset + len(header_b))
+                        f.write(log_entry.encode('utf-8'))
+                        f.write(tail)
+                        f.truncate()
+                        return
+                # 文件被外部改过，偏移失效，走下面的全量路径重新定位
+                self._plot_log_offset = None
+
             with open(agent_file, 'r', encoding='utf-8') as f:
                 content = f.read()
             
-            # 在剧情日志部分添加新条目
-            if "## 剧情日志" in content:
-                content = content.replace("## 剧情日志", f"## 剧情日志{log_entry}")
+            # 在剧情日志部分添加新条目：find一次拿到位置，切片拼接插入，
+            # 不再先in后replace把全文扫两遍
+            header = "## 剧情日志"
+            pos = content.find(header)
+            if pos != -1:
+                insert_at = pos + len(header)
+                content = content[:insert_at] + log_entry + content[insert_at:]
             else:
-                content += f"\n\n## 剧情日志{log_entry}"
+                pos = len(content) + 2  # 补的"\n\n"之后就是标题
+                content += f"\n\n{header}{log_entry}"
                 
             with open(agent_file, 'w', encoding='utf-8') as f:
                 f.write(content)
+
+            # 记下标题位置（字节偏移），下次更新走热路径
+            self._plot_log_offset = len(content[:pos].encode('utf-8'))
     
     def create_next_chapter(self, custom_workflow: Optional[List[WorkflowStep]] = None) -> Dict[str, Any]:
         """创建下一章节"""
@@ -5,9 +5,16 @@
 """
 
 import re
+import sys
 from novel_writing_agent import NovelWritingAgent, ProjectConfig, ChapterSummary
 from datetime import datetime
 
+# 预编译正则：这些模式每章都要跑一遍，别在循环里反复让re重新查缓存
+_CHAPTER_RE = re.compile(r'### \*\*第(\d+)章[：:\s]*([^*]+)\*\*')
+_PLOT_RE = re.compile(r'\*\s*\*\*剧情进展[：:]?\*\*\s*([^*]+)')
+_CHAR_RE = re.compile(r'\*\*([^(（]+)(?:\s*[（(]([^)）]*)[）)])?[：:]?\*\*')
+_CLUE_RE = re.compile(r'\*\s*\*\*关键线索[：:]?\*\*\s*([^*]+)')
+
 def test_and_migrate():
     project_root = "/Users/xiaoyu/逆天仙途：因果投资万倍返还！"
     gemini_file = project_root + "/.gemini/GEMINI.md"
@@ -24,30 +31,14 @@ def test_and_migrate():
     log_content = content[log_start:]
     print(f"剧情日志长度: {len(log_content)}")
     
-    # 简化的章节匹配
+    # 一次 finditer 找出所有章节标题，正文按相邻标题的位置直接切片，
+    # 不再逐行 split + match + join 来回拷贝字符串
+    matches = list(_CHAPTER_RE.finditer(log_content))
     chapters = []
-    lines = log_content.split('\n')
-    
-    current_chapter = None
-    current_content = []
-    
-    for line in lines:
-        # 检查是否是章节标题行
-        chapter_match = re.match(r'### \*\*第(\d+)章[：:\s]*([^*]+)\*\*', line)
-        if chapter_match:
-            # 保存上一章
-            if current_chapter:
-                chapters.append((current_chapter[0], current_chapter[1], '\n'.join(current_content)))
-            
-            # 开始新章节
-            current_chapter = (int(chapter_match.group(1)), chapter_match.group(2).strip())
-            current_content = []
-        elif current_chapter:
-            current_content.append(line)
-    
-    # 保存最后一章
-    if current_chapter:
-        chapters.append((current_chapter[0], current_chapter[1], '\n'.join(current_content)))
+    for i, m in enumerate(matches):
+        body_end = matches[i + 1].start() if i + 1 < len(matches) else len(log_content)
+        body = log_content[m.end():body_end]
+        chapters.append((int(m.group(1)), m.group(2).strip(), body))
     
     print(f"找到章节: {len(chapters)} 个")
     
@@ -64,23 +55,30 @@ def test_and_migrate():
     agent = NovelWritingAgent(project_root, config)
     agent.save_project_config()
     
-    # 导入章节数据
+    # 导入章节数据：先在内存里攒出全部摘要，最后批量入库一次
+    # 导入时间戳取一次就够，不用每章都去查系统时钟
+    import_time = datetime.now().isoformat()
+    summaries = []
     for chapter_num, title, content in chapters:
         # 解析剧情进展
-        plot_match = re.search(r'\*\s*\*\*剧情进展[：:]?\*\*\s*([^*]+)', content)
+        plot_match = _PLOT_RE.search(content)
         plot_progress = plot_match.group(1).strip() if plot_match else ""
         
-        # 解析角色
+        # 解析角色：finditer惰性匹配，凑满5个就停；
+        # 同名角色全书反复出现，intern后各章共享同一个str对象
         characters = []
-        char_matches = re.findall(r'\*\*([^(（]+)(?:\s*[（(]([^)）]*)[）)])?[：:]?\*\*', content)
-        for char_match in char_matches:
-            char_name = char_match[0].strip()
-            if char_name and not char_name.startswith('第') and len(char_name) < 15:
+        seen = set()
+        for m in _CHAR_RE.finditer(content):
+            char_name = sys.intern(m.group(1).strip())
+            if char_name and char_name not in seen and not char_name.startswith('第') and len(char_name) < 15:
+                seen.add(char_name)
                 characters.append(char_name)
+                if len(characters) == 5:
+                    break
         
         # 解析关键线索
         key_events = []
-        clue_match = re.search(r'\*\s*\*\*关键线索[：:]?\*\*\s*([^*]+)', content)
+        clue_match = _CLUE_RE.search(content)
         if clue_match:
             key_events = [clue_match.group(1).strip()]
         
@@ -89,16 +87,16 @@ def test_and_migrate():
             chapter_num=chapter_num,
             title=title,
             content_summary=plot_progress,
-            characters_involved=characters[:5],  # 限制角色数量
+            characters_involved=characters,  # 上面已截到5个
             key_events=key_events,
             word_count=0,
-            created_time=datetime.now().isoformat()
+            created_time=import_time
         )
         
-        agent.add_chapter_summary(summary)
+        summaries.append(summary)
         
         # 添加角色到Agent
-        for char_name in characters[:5]:
+        for char_name in characters:
             if char_name not in agent.characters:
                 from novel_writing_agent import CharacterInfo
                 agent.characters[char_name] = CharacterInfo(
@@ -107,6 +105,7 @@ def test_and_migrate():
                 )
     
     # 保存数据
+    agent.bulk_add_chapter_summaries(summaries)
     agent.save_characters()
     
     print(f"\n=== 迁移完成 ===")
@@ -5,69 +5,166 @@
 """
 
 import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
 
+# numba可选：装了就用JIT的字节扫描器找章节标题，没装回退到正则
+try:
+    import numba
+    import numpy as np
+except ImportError:
+    numba = None
+
+# 模式全部在模块级编译好，函数里只管调用。
+# 章节定位相关的模式按UTF-8字节编译，直接在read_bytes的缓冲上扫，
+# 字节偏移全程一致（\xe7\xac\xac=第 \xe7\xab\xa0=章 \xe5\x8d\xb7=卷）
+CHAPTER_RE = re.compile(rb'### \*\*\xe7\xac\xac(\d+)\xe7\xab\xa0(?:\xef\xbc\x9a|[:\s])*([^*]+)\*\*')
+# 下一章/下一卷合成一个交替模式，一次search同时探两种边界
+NEXT_BOUNDARY_RE = re.compile(rb'\n(?:### \*\*\xe7\xac\xac\d+\xe7\xab\xa0|## \*\*\xe7\xac\xac\d+\xe5\x8d\xb7)')
+LOG_HEADER_RE = re.compile('## \\*?\\*?剧情日志\\*?\\*?'.encode('utf-8'))
+# 剧情进展/角色状态也按字节匹配：整章不再解码，只解码真正要打印的捕获组
+PLOT_RE = re.compile(rb'\*\s*\*\*\xe5\x89\xa7\xe6\x83\x85\xe8\xbf\x9b\xe5\xb1\x95(?:\xef\xbc\x9a|:)?\*\*\s*([^*]+)')
+# 角色名/境界/描述都给了长度上限，格式不符的行立刻失配，
+# 不会让 [^(]+ 一路吞到很远的下一个括号再回溯。
+# 装了第三方regex库就用它（V1引擎对失配密集的文本不靠回溯硬扛），否则用内置re
+_CHAR_PATTERN = rb'\*\*([^(*\n]{1,40})\(([^)\n]{1,20})\)(?:\xef\xbc\x9a|:)?\*\*([^*\n]{0,200})'
+try:
+    import regex as _regex
+    CHAR_RE = _regex.compile(_CHAR_PATTERN, flags=_regex.V1)
+except ImportError:
+    CHAR_RE = re.compile(_CHAR_PATTERN)
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _scan_chapter_heads(buf):
+        """在uint8缓冲里找 b'### **第' 的出现位置（定长字节比较，无正则VM）"""
+        n = buf.shape[0]
+        out = np.empty(1024, dtype=np.int64)
+        count = 0
+        i = 0
+        while i <= n - 9:
+            if (buf[i] == 0x23 and buf[i+1] == 0x23 and buf[i+2] == 0x23
+                    and buf[i+3] == 0x20 and buf[i+4] == 0x2A and buf[i+5] == 0x2A
+                    and buf[i+6] == 0xE7 and buf[i+7] == 0xAC and buf[i+8] == 0xAC):
+                if count == out.shape[0]:
+                    # 缓冲满了就翻倍扩容，不丢任何章节
+                    bigger = np.empty(out.shape[0] * 2, dtype=np.int64)
+                    bigger[:count] = out
+                    out = bigger
+                out[count] = i
+                count += 1
+                i += 9
+            else:
+                i += 1
+        return out[:count]
+
+def _find_chapter_matches(content: bytes, log_start: int):
+    """找出日志区里所有章节标题的match；numba可用时先定位候选，再锚定匹配"""
+    if numba is not None:
+        buf = np.frombuffer(content, dtype=np.uint8)
+        heads = _scan_chapter_heads(buf[log_start:])
+        # 正则只在候选位置做锚定match，不再从头扫整个缓冲
+        matches = [CHAPTER_RE.match(content, log_start + int(pos)) for pos in heads]
+        return [m for m in matches if m]
+    return list(CHAPTER_RE.finditer(content, log_start))
+
+@lru_cache(maxsize=4)
+def _parse_log(path: Path, mtime_ns: int, size: int):
+    """读取并解析章节表；(路径, mtime, size)没变时直接命中缓存"""
+    content = path.read_bytes()
+    # 查找剧情日志位置：带星号/不带星号两种写法合成一个正则，只扫一遍
+    log_match = LOG_HEADER_RE.search(content)
+    if not log_match:
+        return content, -1, []
+    log_start = log_match.start()
+    # 章节表记(编号, 标题, 起, 止)，偏移都是字节偏移
+    chapters = [(m.group(1).decode(), m.group(2).decode('utf-8'), m.start(), m.end())
+                for m in _find_chapter_matches(content, log_start)]
+    return content, log_start, chapters
+
+def _chapter_end(content: bytes, chapters, i: int) -> int:
+    """第i章的结束位置：下一章的起点，最后一章取到下一卷或文件结尾"""
+    if i + 1 < len(chapters):
+        return chapters[i + 1][2]
+    boundary_match = NEXT_BOUNDARY_RE.search(content, chapters[i][2] + 1)
+    return boundary_match.start() if boundary_match else len(content)
+
+def iter_chapters(path: Path):
+    """惰性遍历章节，yield (编号, 标题, 正文bytes)。
+    消费方取多少切多少，配合islice可以提前收工"""
+    st = path.stat()
+    content, log_start, chapters = _parse_log(path, st.st_mtime_ns, st.st_size)
+    if log_start == -1:
+        return
+    for i, (num, title, start, _) in enumerate(chapters):
+        yield num, title, content[start:_chapter_end(content, chapters, i)]
+
+def _parse_chapter(body: bytes):
+    """解析单章正文 -> (剧情进展, 角色列表)。模块级函数，进程池可直接派发"""
+    plot_match = PLOT_RE.search(body)
+    plot = plot_match.group(1).decode('utf-8').strip() if plot_match else ""
+    chars = [(m.group(1).decode('utf-8').strip(), m.group(2).decode('utf-8').strip())
+             for m in CHAR_RE.finditer(body)]
+    return plot, chars
+
+def parse_all_chapters(path: Path):
+    """全量解析所有章节。章节之间互相独立，用进程池并行跑正则；
+    编译好的模式在模块级，fork出来的worker直接继承，不用重编译"""
+    records = list(iter_chapters(path))
+    if not records:
+        return []
+    with ProcessPoolExecutor() as ex:
+        parsed = ex.map(_parse_chapter, (body for _, _, body in records), chunksize=8)
+        return [(num, title.strip(), plot, chars)
+                for (num, title, _), (plot, chars) in zip(records, parsed)]
+
 def quick_test_parser():
     gemini_file = Path("/Users/xiaoyu/逆天仙途：因果投资万倍返还！/.gemini/GEMINI.md")
     
-    with open(gemini_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # 查找剧情日志位置
-    log_start = content.find("## **剧情日志**")
-    if log_start == -1:
-        log_start = content.find("## 剧情日志")
-    
+    st = gemini_file.stat()
+    content, log_start, chapters = _parse_log(gemini_file, st.st_mtime_ns, st.st_size)
     if log_start == -1:
         print("未找到剧情日志")
         return
     
-    # 从剧情日志开始到文件结尾
-    log_content = content[log_start:]
-    print(f"找到剧情日志，长度: {len(log_content)}")
+    # 输出先攒在list里，最后一次性写stdout，省掉十几次print的加锁和flush
+    out = []
     
-    # 查找所有章节
-    chapter_pattern = r'### \*\*第(\d+)章[：:\s]*([^*]+)\*\*'
-    chapters = re.findall(chapter_pattern, log_content)
+    # 不再切出 content[log_start:] 的大副本，后面所有查找都带着偏移
+    # 直接在原字符串上进行
+    out.append(f"找到剧情日志，长度: {len(content) - log_start}")
     
-    print(f"找到章节数量: {len(chapters)}")
-    for i, (num, title) in enumerate(chapters[:5]):  # 只显示前5个
-        print(f"  第{num}章: {title.strip()}")
+    out.append(f"找到章节数量: {len(chapters)}")
+    for num, title, _, _ in islice(chapters, 5):  # 只显示前5个，不复制切片
+        out.append(f"  第{num}章: {title.strip()}")
     
     if chapters:
-        # 测试解析第一个章节的详细内容
-        first_chapter_num, first_title = chapters[0]
+        # 测试解析第一个章节的详细内容：从生成器里只拉第一章
+        _, _, chapter_content = next(iter_chapters(gemini_file))
         
-        # 找到这个章节的完整内容
-        chapter_start = log_content.find(f"### **第{first_chapter_num}章")
-        if chapter_start != -1:
-            # 找到下一个章节的开始位置
-            next_chapter_match = re.search(r'\n### \*\*第\d+章', log_content[chapter_start + 1:])
-            if next_chapter_match:
-                chapter_end = chapter_start + 1 + next_chapter_match.start()
-                chapter_content = log_content[chapter_start:chapter_end]
-            else:
-                # 如果没有下一章，取到下一个卷的开始
-                next_volume_match = re.search(r'\n## \*\*第\d+卷', log_content[chapter_start + 1:])
-                if next_volume_match:
-                    chapter_end = chapter_start + 1 + next_volume_match.start()
-                    chapter_content = log_content[chapter_start:chapter_end]
-                else:
-                    chapter_content = log_content[chapter_start:]
-            
-            print(f"\n第一章内容示例 (前500字符):")
-            print(chapter_content[:500])
-            
-            # 尝试解析其中的剧情进展
-            plot_match = re.search(r'\*\s*\*\*剧情进展[：:]?\*\*\s*([^*]+)', chapter_content)
-            if plot_match:
-                print(f"\n剧情进展: {plot_match.group(1).strip()[:100]}...")
-            
-            # 尝试解析角色状态
-            char_matches = re.findall(r'\*\*([^(]+)\(([^)]+)\)[：:]?\*\*([^*\n]+)', chapter_content)
-            print(f"\n找到角色: {len(char_matches)} 个")
-            for char_name, level, desc in char_matches[:3]:
-                print(f"  {char_name.strip()} ({level.strip()}): {desc.strip()[:50]}...")
+        # 预览只解码开头500字节的窗口，不为看个开头解码整章；
+        # 窗口边缘可能切在多字节字符中间，用replace兜底
+        out.append("\n第一章内容示例 (前500字节):")
+        out.append(chapter_content[:500].decode('utf-8', 'replace'))
+        
+        # 尝试解析其中的剧情进展
+        plot_match = PLOT_RE.search(chapter_content)
+        if plot_match:
+            out.append(f"\n剧情进展: {plot_match.group(1).decode('utf-8').strip()[:100]}...")
+        
+        # 尝试解析角色状态：只展示前3个，finditer凑够就停，
+        # 不为一个预览把整章findall一遍
+        out.append("\n角色状态 (最多显示3个):")
+        for i, m in enumerate(CHAR_RE.finditer(chapter_content)):
+            if i >= 3:
+                break
+            out.append(f"  {m.group(1).decode('utf-8').strip()} ({m.group(2).decode('utf-8').strip()}):"
+                       f" {m.group(3).decode('utf-8').strip()[:50]}...")
+    
+    sys.stdout.write("\n".join(out) + "\n")
 
 if __name__ == "__main__":
     quick_test_parser()
\ No newline at end of file